@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Código común de los scripts 2.py, 3.py y 4.py (análisis de un .sql por chunks
+con Ollama + análisis local con regex). Los scripts solo definen su
+configuración/CLI y llaman a estas funciones; las regex se compilan una vez
+por proceso al importar el módulo.
+"""
+
+import hashlib, json, mmap, os, re, sqlite3, sys, time, requests
+from contextlib import closing, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+
+# Raíz del repo en el path para importar src.lib (los scripts se ejecutan desde src/app)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.lib.chunk_files import append_file, get_processed_chunks, is_newer
+from src.lib.sql_processor import find_create_table
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
+DEFAULT_MODEL = "qwen3:30b"
+OLLAMA_KEEP_ALIVE = "30m"  # el modelo sigue cargado entre chunks
+
+# Sesión HTTP compartida: las peticiones reutilizan conexiones keep-alive con Ollama
+_SESSION = requests.Session()
+
+MAX_RETRIES = 3
+SLEEP_BASE = 2
+CHUNK_CACHE_FILE = ".chunk_cache.sqlite"  # en outdir: hash del chunk → respuesta
+LOCAL_WORKERS = os.cpu_count() or 1
+LOCAL_PARALLEL_MIN_BYTES = 16 * 1024 * 1024  # por debajo, el análisis local va en un solo proceso
+CREATE_SCAN_SLACK = 256  # margen tras el fin de una región para un "CREATE TABLE" que empieza dentro
+
+# Delimitadores de fragmento cuando se empaquetan varios chunks por petición
+FRAG_RE = re.compile(r"===FRAG_BEGIN (\d+)===\s*(.*?)\s*===FRAG_END \1===", re.S)
+
+# ---------------------------
+# LOCAL: análisis de esquema con regex
+# ---------------------------
+# Identificadores SQL en ASCII: re.ASCII evita las clases Unicode de \w y \s.
+# CREATE_RE es de bytes: se aplica directamente sobre el mmap del dump
+CREATE_RE = re.compile(rb"CREATE\s+TABLE\s+[`\"]?(\w+)[`\"]?\s*\((.*?)\);", re.I | re.S | re.ASCII)
+# Una sola pasada por línea: PK de tabla | FK | columna (se prueban en ese orden)
+LINE_RE = re.compile(
+    r"(?:.*?(?P<pk>PRIMARY\s+KEY\s*\((?P<pk_cols>[^)]+)\))"
+    r"|.*?(?P<fk>FOREIGN\s+KEY\s*\((?P<fk_cols>[^)]+)\)\s*REFERENCES\s+[`\"]?(?P<fk_ref>\w+)[`\"]?\s*\((?P<fk_refcols>[^)]+)\))"
+    r"|\s*[`\"]?(?P<col>\w+)[`\"]?\s+(?P<typ>[^\s,]+))",
+    re.I | re.ASCII,
+)
+SPLIT_RE = re.compile(r",\s*\n", re.ASCII)  # solo para cuerpos con líneas que acaban en espacios
+
+def iter_create_tables(sql_buf, start: int = 0, end: int = None, overlapping: bool = False):
+    """
+    Recorre los CREATE TABLE de un buffer de bytes (bytes o mmap). Los candidatos
+    se localizan con find_create_table (.find en C) y CREATE_RE solo se aplica en
+    esas posiciones, no sobre las líneas INSERT.
+    Solo se consideran sentencias que empiezan en [start, end); con overlapping=True
+    tampoco se saltan los candidatos que caen dentro de una sentencia ya encontrada.
+    """
+    if end is None:
+        end = limit = len(sql_buf)
+    else:
+        limit = min(len(sql_buf), end + CREATE_SCAN_SLACK)
+    next_hit = {}
+    pos = find_create_table(sql_buf, start, limit, next_hit)
+    while 0 <= pos < end:
+        m = CREATE_RE.match(sql_buf, pos)
+        if m:
+            yield m
+        resume_at = m.end() if m and not overlapping else pos + 1
+        pos = find_create_table(sql_buf, resume_at, limit, next_hit)
+
+def split_body(body: str):
+    """
+    Líneas (ya sin espacios) del cuerpo de un CREATE TABLE, separadas por la
+    coma de final de línea: str.split en el caso normal y SPLIT_RE solo si hay
+    líneas que acaban en espacios o tabuladores.
+    """
+    if "\r" in body:
+        body = body.replace("\r\n", "\n")
+    if " \n" in body or "\t\n" in body:
+        return [l.strip() for l in SPLIT_RE.split(body)]
+    return [l.strip() for l in body.split(",\n")]
+
+def parse_create_body(body: str):
+    """
+    Columnas, PK y FK del cuerpo de un CREATE TABLE, en listas paralelas
+    (nombres/tipos de columna y columnas/tabla/columnas referenciadas de cada FK).
+    """
+    names, types, pks = [], [], []
+    fk_cols, fk_refs, fk_ref_cols = [], [], []
+    for ln in split_body(body):
+        m = LINE_RE.match(ln)
+        if not m:
+            continue
+        if m.group("pk"):
+            pks = [c.strip(" `\"") for c in m.group("pk_cols").split(",")]
+        elif m.group("fk"):
+            fk_cols.append([c.strip(" `\"") for c in m.group("fk_cols").split(",")])
+            fk_refs.append(m.group("fk_ref"))
+            fk_ref_cols.append([c.strip(" `\"") for c in m.group("fk_refcols").split(",")])
+        else:
+            names.append(m.group("col"))
+            types.append(m.group("typ"))
+    return {"col_names": names, "col_types": types, "primary_key": pks,
+            "fk_cols": fk_cols, "fk_ref_tables": fk_refs, "fk_ref_cols": fk_ref_cols}
+
+def parse_schema_local(sql_buf):
+    """
+    Extrae tablas/columnas/PK/FK de forma sencilla (regex).
+    Acepta str o bytes/mmap; solo se decodifican los cuerpos de los CREATE TABLE.
+    """
+    if isinstance(sql_buf, str):
+        sql_buf = sql_buf.encode("utf-8")
+    schema = {}
+    for m in iter_create_tables(sql_buf):
+        body = m.group(2).decode("utf-8", errors="ignore")
+        schema[m.group(1).decode("ascii")] = parse_create_body(body)
+    return schema
+
+def _parse_schema_region(region):
+    """
+    Trabajo de un proceso: mapea el dump y analiza los CREATE TABLE que empiezan
+    en su región. Devuelve (inicio, fin, tabla, info) para fusionar en orden.
+    """
+    path, start, end = region
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return [(m.start(), m.end(), m.group(1).decode("ascii"),
+                 parse_create_body(m.group(2).decode("utf-8", errors="ignore")))
+                for m in iter_create_tables(mm, start, end, overlapping=True)]
+
+def parse_schema_file(path: str):
+    """
+    Análisis local del dump completo. Si es grande, se reparte por regiones de
+    bytes entre procesos (cada uno mapea el fichero, así que solo viaja el
+    resultado) y al fusionar se descartan, como en la pasada secuencial, las
+    sentencias que empiezan dentro de otra ya aceptada.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return {}
+    if size < LOCAL_PARALLEL_MIN_BYTES or LOCAL_WORKERS < 2:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return parse_schema_local(mm)
+    step = -(-size // (LOCAL_WORKERS * 4))
+    regions = [(path, s, min(s + step, size)) for s in range(0, size, step)]
+    schema, accepted_end = {}, 0
+    with ProcessPoolExecutor(max_workers=LOCAL_WORKERS) as pool:
+        for found in pool.map(_parse_schema_region, regions):
+            for start, stop, table, info in found:
+                if start >= accepted_end:
+                    schema[table] = info
+                    accepted_end = stop
+    return schema
+
+def write_local_markdown(schema: dict, path: str):
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        w = f.write
+        w("# Esquema detectado (Local)\n")
+        for t, d in schema.items():
+            pk = ", ".join(d["primary_key"]) if d["primary_key"] else "-"
+            w("## %s\n**Primary Key**: %s\n\n| Columna | Tipo |\n|---|---|\n" % (t, pk))
+            for c in zip(d["col_names"], d["col_types"]):
+                w("| %s | %s |\n" % c)
+            if d["fk_ref_tables"]:
+                w("\n**FK**:\n")
+                for cols, ref, ref_cols in zip(d["fk_cols"], d["fk_ref_tables"], d["fk_ref_cols"]):
+                    w("- (%s) → %s(%s)\n" % (", ".join(cols), ref, ", ".join(ref_cols)))
+            w("\n")
+
+# ---------------------------
+# API: enviar chunk como texto
+# ---------------------------
+# Instrucciones fijas de los prompts: se construyen una sola vez al importar
+_PROMPT_HEADER = (
+    "Analiza ÚNICAMENTE el fragmento SQL entre ```sql ...```.\n"
+    "Devuelve una explicación clara y (si es posible) una lista estructurada con:\n"
+    "- Tablas y para qué sirven\n"
+    "- Columnas principales (nombre y tipo)\n"
+    "- Claves primarias y foráneas\n"
+    "- Relaciones entre tablas\n"
+    "Si el fragmento está incompleto, indica límites y referencias cruzadas.\n\n"
+)
+_BATCH_PROMPT_HEADER = (
+    "Analiza POR SEPARADO cada fragmento SQL delimitado por ===FRAG_BEGIN nnn=== y ===FRAG_END nnn===.\n"
+    "Para cada fragmento devuelve una explicación clara y (si es posible) una lista estructurada con:\n"
+    "- Tablas y para qué sirven\n"
+    "- Columnas principales (nombre y tipo)\n"
+    "- Claves primarias y foráneas\n"
+    "- Relaciones entre tablas\n"
+    "Si un fragmento está incompleto, indica límites y referencias cruzadas.\n"
+    "Escribe la respuesta de cada fragmento entre las mismas líneas ===FRAG_BEGIN nnn=== "
+    "y ===FRAG_END nnn=== que lo delimitan.\n\n"
+)
+
+def build_prompt(chunk_text: str, idx: int):
+    return f"{_PROMPT_HEADER}--- FRAGMENTO #{idx} ---\n```sql\n{chunk_text}\n```"
+
+def build_batch_prompt(chunks):
+    """Empaqueta varios chunks (idx, texto) en un único prompt delimitado por centinelas."""
+    parts = [_BATCH_PROMPT_HEADER]
+    for idx, chunk_text in chunks:
+        parts.append(f"===FRAG_BEGIN {idx:03d}===\n```sql\n{chunk_text}\n```\n===FRAG_END {idx:03d}===\n")
+    return "".join(parts)
+
+def split_batch_response(text: str):
+    """Devuelve {idx: respuesta} de los fragmentos que llegaron completos."""
+    return {int(m.group(1)): m.group(2) for m in FRAG_RE.finditer(text or "")}
+
+def call_ollama_chunk_text(model, prompt: str):
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE
+    }
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            response = _SESSION.post(OLLAMA_URL, json=payload, timeout=300)
+            response.raise_for_status()
+            return response.json().get("response", "")
+        except Exception as e:
+            print(f"⚠️ Intento {attempt} fallido: {e}")
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(SLEEP_BASE * attempt)
+
+def stream_ollama_chunk_to_file(model, prompt: str, path: str):
+    """
+    Como call_ollama_chunk_text pero con stream=True: vuelca los tokens a disco
+    según llegan. Escribe en path + ".tmp" y lo renombra al terminar, para que un
+    corte a mitad no deje un api_chunk_###.txt incompleto.
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE
+    }
+    tmp = path + ".tmp"
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            with _SESSION.post(OLLAMA_URL, json=payload, timeout=300, stream=True) as response, \
+                 open(tmp, "w", encoding="utf-8") as w:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if "error" in event:
+                        raise RuntimeError(event["error"])
+                    w.write(event.get("response", ""))
+            os.replace(tmp, path)
+            return path
+        except Exception as e:
+            print(f"⚠️ Intento {attempt} fallido: {e}")
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(SLEEP_BASE * attempt)
+
+def process_batch(model, chunks, outdir: str):
+    """
+    Analiza un lote de chunks (idx, texto) y guarda cada respuesta (se ejecuta en
+    un hilo del pool). Un chunk suelto se vuelca a disco en streaming; un lote se
+    reparte por centinelas y, si llega truncado (falta algún FRAG_END), se parte
+    por la mitad.
+    """
+    if len(chunks) == 1:
+        idx, chunk_text = chunks[0]
+        chunk_out = os.path.join(outdir, f"api_chunk_{idx:03d}.txt")
+        stream_ollama_chunk_to_file(model, build_prompt(chunk_text, idx), chunk_out)
+        return {idx: chunk_out}
+    answers = split_batch_response(call_ollama_chunk_text(model, build_batch_prompt(chunks)))
+    if not all(idx in answers for idx, _ in chunks):
+        print(f"✂️  Respuesta incompleta para chunks {chunks[0][0]:03d}-{chunks[-1][0]:03d}, divido el lote.")
+        mid = len(chunks) // 2
+        return {**process_batch(model, chunks[:mid], outdir), **process_batch(model, chunks[mid:], outdir)}
+    saved = {}
+    for idx, _ in chunks:
+        chunk_out = os.path.join(outdir, f"api_chunk_{idx:03d}.txt")
+        with open(chunk_out + ".tmp", "w", encoding="utf-8") as w:
+            w.write(answers[idx] or "")
+        os.replace(chunk_out + ".tmp", chunk_out)
+        saved[idx] = chunk_out
+    return saved
+
+def record_finished(finished, pending: dict, idxf, cache):
+    """
+    Apunta en el índice (ya abierto, binario) los chunks terminados y guarda su respuesta
+    en la caché (si la hay, cache=None la desactiva). Solo desde el hilo principal.
+    """
+    for fut in finished:
+        saved = fut.result()
+        for idx, n_bytes, key in pending.pop(fut):
+            idxf.write(b"%d\t%d\t%s\n" % (idx, n_bytes, os.fsencode(saved[idx])))
+            if cache is not None:
+                with open(saved[idx], "rb") as f:
+                    cache.execute("INSERT OR REPLACE INTO cache (hash, response) VALUES (?, ?)", (key, f.read()))
+    if cache is not None:
+        cache.commit()
+
+# ---------------------------
+# CACHÉ: chunks idénticos (cabeceras, bloques repetidos)
+# ---------------------------
+def open_chunk_cache(outdir: str):
+    """Abre (o crea) la caché persistente de respuestas por hash de chunk."""
+    cache = sqlite3.connect(os.path.join(outdir, CHUNK_CACHE_FILE))
+    cache.execute("CREATE TABLE IF NOT EXISTS cache (hash TEXT PRIMARY KEY, response BLOB)")
+    return cache
+
+# Las instrucciones de los prompts forman parte de la clave: si cambian, las respuestas
+# guardadas con las anteriores dejan de reutilizarse
+_CHUNK_HASH_BASE = hashlib.blake2b(digest_size=16)
+_CHUNK_HASH_BASE.update(_PROMPT_HEADER.encode("utf-8"))
+_CHUNK_HASH_BASE.update(_BATCH_PROMPT_HEADER.encode("utf-8"))
+
+def chunk_hash(model, raw: bytes) -> str:
+    """Hash del chunk en bruto (sin decodificar) junto con el modelo y los prompts que lo analizan."""
+    h = _CHUNK_HASH_BASE.copy()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(raw)
+    return h.hexdigest()
+
+def cached_response(cache, key: str):
+    row = cache.execute("SELECT response FROM cache WHERE hash = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+# ---------------------------
+# RESUME helpers
+# ---------------------------
+def skip_chars_for_chunks(fh, chunks_to_skip: int, chunk_size: int):
+    """
+    Avanza el puntero del mmap saltando 'chunks_to_skip' trozos con un seek,
+    sin leerlos. Se limita al final del fichero (mmap.seek no admite pasarse).
+    """
+    fh.seek(min(fh.tell() + chunks_to_skip * chunk_size, len(fh)))
+
+# ---------------------------
+# PIPELINE
+# ---------------------------
+def run_api_chunks(sql_path: str, outdir: str, model, chunk_chars: int, workers: int,
+                   batch_size: int, done=frozenset(), start_index: int = 1, use_cache: bool = True):
+    """
+    Envía el dump a Ollama por chunks de bytes, con hasta `workers` lotes en vuelo.
+    Salta los índices de `done` y, si start_index > 1, todo lo anterior con un seek.
+    Con use_cache=False no se consulta ni se guarda nada en CHUNK_CACHE_FILE.
+    Devuelve la ruta de api_index.tsv.
+    """
+    api_index_path = os.path.join(outdir, "api_index.tsv")
+    _SESSION.mount("http://", HTTPAdapter(pool_maxsize=workers))  # una conexión por hilo
+    idx = 1
+    pending, batch, chunk_meta = {}, [], {}
+    with open(sql_path, "rb") as f_raw, \
+         mmap.mmap(f_raw.fileno(), 0, access=mmap.ACCESS_READ) as f_in, \
+         open(api_index_path, "ab", buffering=0) as idxf, \
+         (closing(open_chunk_cache(outdir)) if use_cache else nullcontext()) as cache, \
+         ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def dispatch(chunks):
+            fut = executor.submit(process_batch, model, chunks, outdir)
+            pending[fut] = [(i, *chunk_meta.pop(i)) for i, _ in chunks]
+            # no leer más del fichero hasta que quede un hueco libre
+            if len(pending) >= workers:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                record_finished(finished, pending, idxf, cache)
+
+        # saltar lo ya cubierto
+        if start_index > 1:
+            skip_chars_for_chunks(f_in, start_index - 1, chunk_chars)
+            idx = start_index
+
+        buffer = f_in.read(chunk_chars)
+        while buffer:
+            if idx in done:
+                print(f"⏭️  Chunk {idx:03d} ya existe, salto.")
+                idx += 1
+                buffer = f_in.read(chunk_chars)
+                continue
+
+            # chunk idéntico a uno ya analizado (en esta u otra ejecución): reutilizar
+            key = chunk_hash(model, buffer) if use_cache else None
+            cached = cached_response(cache, key) if use_cache else None
+            if cached is not None:
+                chunk_out = os.path.join(outdir, f"api_chunk_{idx:03d}.txt")
+                with open(chunk_out + ".tmp", "wb") as w:
+                    w.write(cached)
+                os.replace(chunk_out + ".tmp", chunk_out)
+                idxf.write(b"%d\t%d\t%s\n" % (idx, len(buffer), os.fsencode(chunk_out)))
+                print(f"♻️  Chunk {idx:03d} idéntico a uno ya analizado, reutilizo la respuesta.")
+                idx += 1
+                buffer = f_in.read(chunk_chars)
+                continue
+
+            print(f"🤖 Analizando chunk {idx:03d} (len={len(buffer):,} bytes) con {model}…")
+            chunk_meta[idx] = (len(buffer), key)
+            batch.append((idx, buffer.decode("utf-8", errors="ignore")))
+            if len(batch) >= batch_size:
+                dispatch(batch)
+                batch = []
+
+            idx += 1
+            buffer = f_in.read(chunk_chars)
+
+        if batch:
+            dispatch(batch)
+        record_finished(wait(pending).done, pending, idxf, cache)
+    return api_index_path
+
+def combine_api_chunks(outdir: str):
+    """Une los api_chunk_###.txt en orden (copia binaria, sin decodificar)."""
+    combined_path = os.path.join(outdir, "analysis_api_combined.txt")
+    with open(combined_path, "wb") as out_all:
+        for idx in sorted(get_processed_chunks(outdir)):
+            fn = f"api_chunk_{idx:03d}.txt"
+            out_all.write(b"===== %s =====\n" % fn.encode())
+            append_file(out_all, os.path.join(outdir, fn))
+            out_all.write(b"\n\n")
+    print(f"📊 Resultado API combinado: {combined_path}")
+    return combined_path
+
+def run_local_analysis(sql_path: str, outdir: str, reuse: bool = False):
+    """
+    Análisis local (regex) del dump completo → outdir/analysis_local.md
+    Con reuse=True no se repite si el .md es posterior al SQL.
+    """
+    local_md_path = os.path.join(outdir, "analysis_local.md")
+    if reuse and is_newer(local_md_path, sql_path):
+        print(f"\n⏭️  {local_md_path} es posterior al SQL: se omite el análisis local.")
+        return local_md_path
+    print("\n🔍 Analizando en local (regex)…")
+    write_local_markdown(parse_schema_file(sql_path), local_md_path)
+    print(f"📘 Resultado local: {local_md_path}")
+    return local_md_path
@@ -16,22 +16,20 @@ import argparse
 import os
 
 def guess_type(path):
-    # Leer primeras líneas como texto
+    # Leer la cabecera y buscar sobre los bytes, sin decodificar
     with open(path, "rb") as f:
         head = f.read(2048)  # primeros 2 KB
-    try:
-        text = head.decode("utf-8", errors="ignore")
-    except Exception:
-        return "Binario (no texto)"
 
-    lowered = text.lower()
-    if "create table" in lowered or "insert into" in lowered or "alter table" in lowered:
-        return "SQL dump (texto con sentencias SQL)"
-    if lowered.startswith("pk\x03\x04"):
+    # Firmas binarias: se comparan tal cual
+    if head.startswith(b"PK\x03\x04"):
         return "ZIP (binario comprimido)"
-    if lowered.startswith("%pdf"):
+    if head.startswith(b"%PDF"):
         return "PDF"
-    if lowered.startswith("{") or lowered.startswith("["):
+
+    lowered = head.lower()  # bytes.lower: solo ASCII, suficiente para palabras clave SQL
+    if b"create table" in lowered or b"insert into" in lowered or b"alter table" in lowered:
+        return "SQL dump (texto con sentencias SQL)"
+    if lowered.startswith(b"{") or lowered.startswith(b"["):
         return "JSON (probable)"
     return "Texto (sin patrones SQL claros)"
 
@@ -0,0 +1,48 @@
+import os
+import re
+import shutil
+from typing import Set
+
+# Salidas por chunk: api_chunk_001.txt, api_chunk_002.txt, ... (los .tmp a medias no encajan)
+CHUNK_FILENAME_RE = re.compile(r"api_chunk_(\d+)\.txt$")
+
+
+def get_processed_chunks(outdir) -> Set[int]:
+    """Índices de los chunks ya guardados en `outdir` (str o Path) como api_chunk_###.txt."""
+    if not os.path.isdir(outdir):
+        return set()
+    # Una sola pasada por el directorio; luego se consulta el set en memoria
+    with os.scandir(outdir) as it:
+        return {int(m.group(1)) for e in it
+                if (m := CHUNK_FILENAME_RE.match(e.name)) and e.is_file()}
+
+
+def is_newer(path, than) -> bool:
+    """True si `path` existe y se modificó después que `than`."""
+    try:
+        return os.stat(path).st_mtime_ns > os.stat(than).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def append_file(out, path) -> None:
+    """
+    Añade el contenido de `path` al final de `out` (abierto en binario). Con
+    os.sendfile (Linux) la copia se hace en el kernel; si no está disponible o
+    falla, se copia con shutil.copyfileobj por bloques de 1 MB.
+    """
+    with open(path, "rb") as src:
+        offset = 0
+        if hasattr(os, "sendfile"):
+            out.flush()  # lo pendiente en el buffer de `out` va antes que el contenido
+            size = os.fstat(src.fileno()).st_size
+            try:
+                while offset < size:
+                    sent = os.sendfile(out.fileno(), src.fileno(), offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return
+            except OSError:
+                src.seek(offset)
+        shutil.copyfileobj(src, out, 1 << 20)
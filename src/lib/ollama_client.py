@@ -3,13 +3,21 @@ import time
 import requests
 from concurrent.futures import ThreadPoolExecutor
 
+# Instrucciones fijas del prompt de cada chunk (src/main.py y src/main_optimized.py)
+CHUNK_PROMPT_HEADER = "Analiza el siguiente fragmento SQL y extrae las tablas, relaciones y propósito.\n"
+
+def build_chunk_prompt(chunk_idx: int, chunk_text: str) -> str:
+    """Prompt de un chunk: instrucciones fijas + el fragmento SQL numerado."""
+    return f"{CHUNK_PROMPT_HEADER}--- CHUNK {chunk_idx} ---\n```sql\n{chunk_text}\n```"
+
 class OllamaClient:
-    def __init__(self, url: str = "http://localhost:11434/api/generate", model: str = "qwen3:30b", max_retries: int = 3, temperature: float = 0.7, num_ctx: int = 8192):
+    def __init__(self, url: str = "http://localhost:11434/api/generate", model: str = "qwen3:30b", max_retries: int = 3, temperature: float = 0.7, num_ctx: int = 8192, keep_alive: str = "30m"):
         self.url = url
         self.model = model
         self.max_retries = max_retries
         self.temperature = temperature
         self.num_ctx = num_ctx
+        self.keep_alive = keep_alive  # tiempo que Ollama mantiene el modelo cargado tras cada llamada
         self._cache: dict[str, str] = {}
 
 
@@ -23,6 +31,7 @@ class OllamaClient:
             "model": self.model, 
             "prompt": prompt, 
             "stream": False,
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": self.temperature,
                 "num_ctx": self.num_ctx
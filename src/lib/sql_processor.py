@@ -1,12 +1,69 @@
 import re
 import logging
 
+try:
+    import re2 as _re_fast  # google-re2 opcional: tiempo lineal, sin backtracking
+except ImportError:
+    _re_fast = re
+
+# Casings de CREATE que se buscan con .find (en C) antes de cualquier regex; TABLE
+# puede ir en cualquier casing. Los comparten src/main.py (str), src/app/_core.py
+# (bytes, sobre el mmap) y SQLProcessor para que los tres encuentren las mismas tablas.
+CREATE_TOKENS = ("CREATE", "create", "Create")
+_CREATE_TOKENS_BYTES = tuple(tok.encode() for tok in CREATE_TOKENS)
+_CREATE_TABLE_RE = re.compile(r"create\s+table", re.I)
+_CREATE_TABLE_BYTES_RE = re.compile(rb"create\s+table", re.I)
+
+def find_create_table(buf, pos: int, limit: int, next_hit: dict) -> int:
+    """
+    Posición del siguiente "CREATE TABLE" de buf[pos:limit] (str, bytes o mmap), o -1.
+    `next_hit` guarda entre llamadas la siguiente aparición de cada token de
+    CREATE_TOKENS, así que un recorrido completo busca cada token una sola vez;
+    cada recorrido empieza con un dict vacío y usa siempre el mismo `limit`.
+    """
+    if isinstance(buf, str):
+        tokens, table_re = CREATE_TOKENS, _CREATE_TABLE_RE
+    else:
+        tokens, table_re = _CREATE_TOKENS_BYTES, _CREATE_TABLE_BYTES_RE
+    while True:
+        for tok in tokens:
+            p = next_hit.get(tok)
+            if p is None or 0 <= p < pos:
+                next_hit[tok] = buf.find(tok, pos, limit)
+        hits = [p for p in next_hit.values() if p >= 0]
+        if not hits:
+            return -1
+        pos = min(hits)
+        if table_re.match(buf, pos):
+            return pos
+        pos += 1
+
+# Regex de parse_schema_local, compiladas una sola vez al importar el módulo.
+# Soportan esquemas (ab."Tabla") y comillas.
+# _CREATE_RE delimita el cuerpo con (.*?) y es la única que puede ir por RE2;
+# _LINE_RE usa lookahead, que RE2 no soporta, y se queda en `re`.
+# Los flags van en línea ((?is)): google-re2 no acepta los flags de `re` en compile()
+_CREATE_PATTERN = r"(?is)CREATE\s+TABLE\s+(?:[^\s(]+\.)?[\"\`]?(\w+)[\"\`]?\s*\((.*?)\)\s*;"
+# google-re2 vuelve a codificar un str entero en cada match(texto, pos) (cuadrático
+# con un match por tabla): con re2 la regex es de bytes y el texto se codifica una vez
+_CREATE_ON_BYTES = _re_fast is not re
+_CREATE_RE = _re_fast.compile(_CREATE_PATTERN.encode() if _CREATE_ON_BYTES else _CREATE_PATTERN)
+# Una sola pasada por línea, probando en orden: PK de tabla | FK | columna (+ PK en línea)
+_LINE_RE = re.compile(
+    r"(?:.*?(?P<pk>PRIMARY\s+KEY\s*\((?P<pk_cols>[^)]+)\))"
+    r"|.*?(?P<fk>FOREIGN\s+KEY\s*\((?P<fk_cols>[^)]+)\)\s*REFERENCES\s+(?:[^\s(]+\.)?[\"\`]?(?P<fk_ref>\w+)[\"\`]?\s*\((?P<fk_refcols>[^)]+)\))"
+    r"|(?=(?:.*?(?P<pk_inline>PRIMARY\s+KEY))?)\s*[\"\`]?(?P<col>\w+)[\"\`]?\s+(?P<typ>[^\s,(]+))",
+    re.I | re.S,
+)
+_BODY_SPLIT_RE = re.compile(r",\s*\n|,\s*$")
+
 class SQLProcessor:
     def __init__(self, rows_to_keep: int = 5) -> None:
         self.rows_to_keep = rows_to_keep
         # Regex para detectar bloques de INSERT y COPY
         self.insert_start_pattern = re.compile(r"^INSERT\s+INTO\s+.*?\s+VALUES", re.IGNORECASE)
         self.copy_start_pattern = re.compile(r"^COPY\s+[`\"]?(\w+)[\w.`\"]*?\s*\(.*?\)\s+FROM\s+stdin\s*;", re.IGNORECASE)
+        self.insert_table_pattern = re.compile(r"INSERT\s+INTO\s+[`\"]?(\w+)[`\"]?", re.IGNORECASE)
 
     def generate_skeleton(self, sql_filepath: str, output_filepath: str) -> None:
         """Genera un esqueleto del SQL manteniendo esquema y truncando datos (soporta COPY y INSERT)."""
@@ -29,7 +86,7 @@ class SQLProcessor:
                     in_data_block = True
                     is_copy = False
                     rows_count = 0
-                    m = re.search(r"INSERT\s+INTO\s+[`\"]?(\w+)[`\"]?", clean_line, re.I)
+                    m = self.insert_table_pattern.search(clean_line)
                     if m: current_table = m.group(1)
                 
                 # Detectar inicio de COPY
@@ -78,36 +135,47 @@ class SQLProcessor:
     @staticmethod
     def parse_schema_local(sql_text: str):
         """Extrae tablas/columnas/PK/FK usando regex (Copiado de main.py pero modularizado)."""
-        # Regex mejorada para soportar esquemas (ab."Tabla") y comillas
-        CREATE_RE = re.compile(r"CREATE\s+TABLE\s+(?:[^\s(]+\.)?[\"\`]?(\w+)[\"\`]?\s*\((.*?)\)\s*;", re.I | re.S)
-        COLUMN_RE = re.compile(r"^\s*[\"\`]?(\w+)[\"\`]?\s+([^\s,(]+)", re.I)
-        PK_TABLE_RE = re.compile(r"PRIMARY\s+KEY\s*\(([^)]+)\)", re.I)
-        PK_INLINE_RE = re.compile(r"PRIMARY\s+KEY", re.I)
-        FK_RE = re.compile(r"FOREIGN\s+KEY\s*\(([^)]+)\)\s*REFERENCES\s+(?:[^\s(]+\.)?[\"\`]?(\w+)[\"\`]?\s*\(([^)]+)\)", re.I)
-
         schema = {}
-        for m in CREATE_RE.finditer(sql_text):
+        # Sin ningún token de CREATE_TOKENS (str.find en C) no hay CREATE TABLE que
+        # buscar: p. ej. dumps o chunks solo con INSERT. El primer candidato queda
+        # en `next_hit` y el recorrido sigue desde ahí sin repetir la búsqueda.
+        next_hit = {}
+        cand = find_create_table(sql_text, 0, len(sql_text), next_hit)
+        if cand < 0:
+            return schema
+        data = sql_text
+        if _CREATE_ON_BYTES:
+            data = sql_text.encode("utf-8", "surrogatepass")
+            next_hit = {}
+            cand = find_create_table(data, 0, len(data), next_hit)
+        while cand >= 0:
+            m = _CREATE_RE.match(data, cand)
+            if not m:
+                cand = find_create_table(data, cand + 1, len(data), next_hit)
+                continue
+            cand = find_create_table(data, m.end(), len(data), next_hit)
             table = m.group(1)
             body = m.group(2)
-            lines = [l.strip() for l in re.split(r",\s*\n|,\s*$", body)]
+            if _CREATE_ON_BYTES:
+                table = table.decode("utf-8", "surrogatepass")
+                body = body.decode("utf-8", "surrogatepass")
+            lines = [l.strip() for l in _BODY_SPLIT_RE.split(body)]
             cols = []
             pks = []
             fks = []
             for ln in lines:
-                pk_m = PK_TABLE_RE.search(ln)
-                if pk_m:
-                    pks.extend([c.strip(" `\"") for c in pk_m.group(1).split(",")])
-                    continue
-                fk_m = FK_RE.search(ln)
-                if fk_m:
-                    cols_fk = [c.strip(" `\"") for c in fk_m.group(1).split(",")]
-                    fks.append({"columns": cols_fk, "ref_table": fk_m.group(2), "ref_columns": [c.strip(" `\"") for c in fk_m.group(3).split(",")]})
+                lm = _LINE_RE.match(ln)
+                if not lm:
                     continue
-                col_m = COLUMN_RE.match(ln)
-                if col_m:
-                    col, typ = col_m.group(1), col_m.group(2)
-                    cols.append({"name": col, "type": typ})
-                    if PK_INLINE_RE.search(ln):
+                if lm.group("pk"):
+                    pks.extend([c.strip(" `\"") for c in lm.group("pk_cols").split(",")])
+                elif lm.group("fk"):
+                    cols_fk = [c.strip(" `\"") for c in lm.group("fk_cols").split(",")]
+                    fks.append({"columns": cols_fk, "ref_table": lm.group("fk_ref"), "ref_columns": [c.strip(" `\"") for c in lm.group("fk_refcols").split(",")]})
+                else:
+                    col = lm.group("col")
+                    cols.append({"name": col, "type": lm.group("typ")})
+                    if lm.group("pk_inline"):
                         pks.append(col)
             schema[table] = {"columns": cols, "primary_key": pks, "foreign_keys": fks}
         return schema
@@ -1,13 +1,24 @@
 import argparse
+import hashlib
 import logging
-import math
+import os
 import re
 import sys
+import tempfile
 import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from multiprocessing import Pool
 from pathlib import Path
-from typing import Dict, Any, List, Set
+from typing import Dict, Any, BinaryIO, Iterator, List, Optional, Set, TextIO, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+# Raíz del repo en el path para importar src.lib también al ejecutar este fichero directamente
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.lib.chunk_files import append_file, get_processed_chunks, is_newer
+from src.lib.ollama_client import build_chunk_prompt
+from src.lib.sql_processor import find_create_table
 
 # ========================
 # CONFIGURACIÓN OLLAMA
@@ -16,6 +27,37 @@ OLLAMA_URL = "http://localhost:11434/api/generate"
 DEFAULT_MODEL = "qwen3:30b"
 CHUNK_CHARS = 200_000
 MAX_RETRIES = 3
+DEFAULT_WORKERS = 3  # peticiones a Ollama en vuelo
+OLLAMA_KEEP_ALIVE = "30m"  # el modelo sigue cargado entre chunks
+CACHE_DIR = Path.home() / ".cache" / "ollama_chunks"  # respuestas por (modelo, prompt), compartida entre ejecuciones
+
+# Sesión HTTP compartida: reutiliza las conexiones keep-alive con Ollama entre chunks
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_maxsize=DEFAULT_WORKERS))
+
+# Regex del análisis local: se compilan una vez al importar el módulo
+# Cabecera de un CREATE TABLE hasta el "(" que abre el cuerpo; el cierre se busca contando paréntesis
+_CREATE_HEAD_RE = re.compile(r"CREATE\s+TABLE\s+[`\"]?(\w+)[`\"]?\s*\(", re.I)
+# Paréntesis del cuerpo. Se saltan enteros los literales '...', "..." y `...` (sin cruzar
+# líneas) y los comentarios -- hasta fin de línea; una comilla suelta queda aparte
+_PAREN_RE = re.compile(r"""[()]|'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"|`[^`\n]*`|--[^\n]*|['"`]""")
+_LONE_QUOTES = ("'", '"', "`")
+# Terminador clásico de la sentencia, para cuerpos con una comilla sin cerrar
+_STMT_END_RE = re.compile(r"\)\s*;")
+# Una sola pasada por línea, probando en orden: PK de tabla | FK | columna (+ PK en línea)
+_LINE_RE = re.compile(
+    r"(?:.*?(?P<pk>PRIMARY\s+KEY\s*\((?P<pk_cols>[^)]+)\))"
+    r"|.*?(?P<fk>FOREIGN\s+KEY\s*\((?P<fk_cols>[^)]+)\)\s*REFERENCES\s+[`\"]?(?P<fk_ref>\w+)[`\"]?\s*\((?P<fk_refcols>[^)]+)\))"
+    r"|(?=(?:.*?(?P<pk_inline>PRIMARY\s+KEY))?)\s*[`\"]?(?P<col>\w+)[`\"]?\s+(?P<typ>[^\s,]+))",
+    re.I | re.S,
+)
+_BODY_SPLIT_RE = re.compile(r",\s*\n|,\s*$")  # solo para cuerpos con líneas que acaban en espacios
+_CREATE_HEAD_TAIL = 256  # caracteres retenidos por si una cabecera queda partida entre bloques
+_MAX_CREATE_CHARS = 1 << 20  # un CREATE TABLE que no se cierra en este tramo se descarta
+# Tablas a partir de las que _parse_bodies usa un Pool de procesos. Medido en 1 CPU:
+# ~25 µs por cuerpo en serie y ~15 µs más por cuerpo para repartirlo (pickle + colas)
+_PARALLEL_MIN_TABLES = 10000
+_LOCAL_WORKERS = os.cpu_count() or 1
 
 def setup_logging(outdir: Path):
     """Configura el sistema de logs (archivo + consola)."""
@@ -29,47 +71,150 @@ def setup_logging(outdir: Path):
         ]
     )
 
+def _split_body(body: str) -> List[str]:
+    """
+    Trozos (ya sin espacios) del cuerpo de un CREATE TABLE, separados por la
+    coma de final de línea. Con str.split en el caso normal; la regex solo se
+    usa si alguna línea acaba en espacios o tabuladores.
+    """
+    if "\r" in body:
+        body = body.replace("\r\n", "\n")
+    if " \n" in body or "\t\n" in body:
+        return [l.strip() for l in _BODY_SPLIT_RE.split(body)]
+    lines = [l.strip() for l in body.split(",\n")]
+    if lines[-1].endswith(","):
+        lines[-1] = lines[-1][:-1].rstrip()
+    return lines
+
+def _parse_table_body(body: str) -> Dict[str, Any]:
+    """
+    Columnas, PK y FK del cuerpo de un CREATE TABLE en columnas paralelas
+    (una lista por campo) en lugar de un dict por columna/FK.
+    """
+    names: List[str] = []
+    types: List[str] = []
+    pks: List[str] = []
+    fk_cols: List[List[str]] = []
+    fk_refs: List[str] = []
+    fk_ref_cols: List[List[str]] = []
+    for ln in _split_body(body):
+        m = _LINE_RE.match(ln)
+        if not m:
+            continue
+        if m.group("pk"):
+            pks.extend([c.strip(" `\"") for c in m.group("pk_cols").split(",")])
+        elif m.group("fk"):
+            fk_cols.append([c.strip(" `\"") for c in m.group("fk_cols").split(",")])
+            fk_refs.append(m.group("fk_ref"))
+            fk_ref_cols.append([c.strip(" `\"") for c in m.group("fk_refcols").split(",")])
+        else:
+            col = m.group("col")
+            names.append(col)
+            types.append(m.group("typ"))
+            if m.group("pk_inline"):
+                pks.append(col)
+    return {"col_names": names, "col_types": types, "primary_key": pks,
+            "fk_cols": fk_cols, "fk_ref_tables": fk_refs, "fk_ref_cols": fk_ref_cols}
+
+def _body_end(sql_text: str, lp: int, limit: int, final: bool = True) -> int:
+    """
+    Posición del ")" que cierra el "(" de `lp` antes de `limit`, o -1 si no se
+    cierra. Con final=False el texto puede continuar (lectura por bloques) y una
+    comilla suelta en una línea aún incompleta deja la decisión para más tarde.
+    """
+    final = final or limit <= len(sql_text)
+    depth = 0
+    for m in _PAREN_RE.finditer(sql_text, lp, limit):
+        tok = m.group()
+        if tok == "(":
+            depth += 1
+        elif tok == ")":
+            depth -= 1
+            if depth == 0:
+                return m.start()
+        elif tok in _LONE_QUOTES:
+            # Literal sin cerrar en su línea: no se puede seguir contando paréntesis,
+            # el cuerpo acaba en el primer ");" como en la regex clásica
+            if not final and sql_text.find("\n", m.start(), limit) < 0:
+                return -1
+            end = _STMT_END_RE.search(sql_text, lp, limit)
+            return end.start() if end else -1
+    return -1
+
+def _iter_create_tables(sql_text: str, final: bool = True) -> Iterator[Tuple[str, str, int, int]]:
+    """
+    Recorre los CREATE TABLE: los candidatos se localizan con find_create_table y el
+    cuerpo se delimita contando paréntesis, sin regex sobre el cuerpo completo.
+    Genera (tabla, cuerpo, inicio, fin); fin == -1 marca un cuerpo sin cerrar en
+    los _MAX_CREATE_CHARS siguientes (o, con final=False, aún sin cerrar en el
+    texto leído) y el recorrido sigue con el siguiente candidato.
+    """
+    next_hit: Dict[str, int] = {}
+    start = find_create_table(sql_text, 0, len(sql_text), next_hit)
+    while start >= 0:
+        resume_at = start + 1
+        head = _CREATE_HEAD_RE.match(sql_text, start)
+        if head:
+            end = _body_end(sql_text, head.end() - 1, start + _MAX_CREATE_CHARS, final)
+            if end < 0:
+                yield head.group(1), "", start, -1
+            else:
+                yield head.group(1), sql_text[head.end():end], start, end
+                resume_at = end + 1
+        start = find_create_table(sql_text, resume_at, len(sql_text), next_hit)
+
+def _parse_one_body(pair: Tuple[str, str]) -> Tuple[str, Dict[str, Any]]:
+    """Tarea del Pool: parsea el cuerpo de una tabla."""
+    table, body = pair
+    return table, _parse_table_body(body)
+
+def _parse_bodies(pairs: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """
+    Parsea los cuerpos (tabla, cuerpo) en orden. Con muchas tablas y varias CPU
+    se reparten en un Pool de procesos; con pocas tablas o una sola CPU, el
+    reparto cuesta más que parsear en serie.
+    """
+    if len(pairs) < _PARALLEL_MIN_TABLES or _LOCAL_WORKERS < 2:
+        return dict(map(_parse_one_body, pairs))
+    # imap (no imap_unordered) para conservar el orden de las tablas en el dump
+    with Pool(_LOCAL_WORKERS) as pool:
+        return dict(pool.imap(_parse_one_body, pairs, chunksize=64))
+
 def parse_schema_local(sql_text: str) -> Dict[str, Any]:
     """Extrae tablas/columnas/PK/FK de forma determinística usando regex."""
-    CREATE_RE = re.compile(r"CREATE\s+TABLE\s+[`\"]?(\w+)[`\"]?\s*\((.*?)\)\s*;", re.I | re.S)
-    COLUMN_RE = re.compile(r"^\s*[`\"]?(\w+)[`\"]?\s+([^\s,]+)", re.I)
-    PK_TABLE_RE = re.compile(r"PRIMARY\s+KEY\s*\(([^)]+)\)", re.I)
-    PK_INLINE_RE = re.compile(r"PRIMARY\s+KEY", re.I)
-    FK_RE = re.compile(r"FOREIGN\s+KEY\s*\(([^)]+)\)\s*REFERENCES\s+[`\"]?(\w+)[`\"]?\s*\(([^)]+)\)", re.I)
-
-    schema: Dict[str, Any] = {}
-    for m in CREATE_RE.finditer(sql_text):
-        table = m.group(1)
-        body = m.group(2)
-        lines = [l.strip() for l in re.split(r",\s*\n|,\s*$", body)]
-        cols: List[Dict[str, str]] = []
-        pks: List[str] = []
-        fks: List[Dict[str, Any]] = []
-        for ln in lines:
-            pk_m = PK_TABLE_RE.search(ln)
-            if pk_m:
-                pks.extend([c.strip(" `\"") for c in pk_m.group(1).split(",")])
-                continue
-            fk_m = FK_RE.search(ln)
-            if fk_m:
-                cols_fk = [c.strip(" `\"") for c in fk_m.group(1).split(",")]
-                fks.append({"columns": cols_fk, "ref_table": fk_m.group(2), "ref_columns": [c.strip(" `\"") for c in fk_m.group(3).split(",")]})
-                continue
-            col_m = COLUMN_RE.match(ln)
-            if col_m:
-                col, typ = col_m.group(1), col_m.group(2)
-                cols.append({"name": col, "type": typ})
-                if PK_INLINE_RE.search(ln):
-                    pks.append(col)
-        schema[table] = {"columns": cols, "primary_key": pks, "foreign_keys": fks}
-    return schema
+    return _parse_bodies([(table, body) for table, body, _, end in _iter_create_tables(sql_text) if end >= 0])
+
+def parse_schema_stream(fh: TextIO, block_size: int = CHUNK_CHARS) -> Dict[str, Any]:
+    """
+    Igual que parse_schema_local pero leyendo el fichero por bloques: solo se
+    retiene el texto desde el primer CREATE TABLE que aún no se ha cerrado, y
+    como mucho _MAX_CREATE_CHARS (pasado ese tramo se descarta, igual que en
+    parse_schema_local). Los cuerpos se guardan y se parsean al final con
+    _parse_bodies (en paralelo si hay muchas tablas).
+    """
+    pairs: List[Tuple[str, str]] = []
+    carry = ""
+    while True:
+        block = fh.read(block_size)
+        buf = carry + block
+        pos, unclosed = 0, -1
+        for table, body, start, end in _iter_create_tables(buf, final=not block):
+            if end >= 0:
+                pairs.append((table, body))
+                pos = end + 1
+            elif block and len(buf) < start + _MAX_CREATE_CHARS:
+                unclosed = start  # puede cerrarse en el siguiente bloque
+                break
+        if not block:
+            return _parse_bodies(pairs)
+        carry = buf[unclosed if unclosed >= 0 else max(pos, len(buf) - _CREATE_HEAD_TAIL):]
 
 def call_ollama(model: str, prompt: str) -> str:
     """Llamada robusta a Ollama local."""
-    payload = {"model": model, "prompt": prompt, "stream": False}
+    payload = {"model": model, "prompt": prompt, "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE}
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = requests.post(OLLAMA_URL, json=payload, timeout=300)
+            resp = _SESSION.post(OLLAMA_URL, json=payload, timeout=300)
             resp.raise_for_status()
             return resp.json().get("response", "")
         except Exception as e:
@@ -79,86 +224,136 @@ def call_ollama(model: str, prompt: str) -> str:
             time.sleep(2 * attempt)
     return ""
 
-def get_processed_chunks(outdir: Path) -> Set[int]:
-    """Detecta qué chunks ya existen en disco."""
-    processed = set()
-    for f in outdir.glob("api_chunk_*.txt"):
-        m = re.match(r"api_chunk_(\d+)\.txt", f.name)
-        if m:
-            processed.add(int(m.group(1)))
-    return processed
+def call_ollama_cached(model: str, prompt: str, cache_dir: Optional[Path] = None) -> str:
+    """
+    call_ollama con caché en disco direccionada por contenido: si el mismo
+    modelo ya respondió al mismo prompt se reutiliza la respuesta. Sin
+    cache_dir se llama siempre a Ollama.
+    """
+    if cache_dir is None:
+        return call_ollama(model, prompt)
+    key = hashlib.blake2b(f"{model}\0{prompt}".encode("utf-8"), digest_size=16).hexdigest()
+    cache_path = cache_dir / f"{key}.txt"
+    try:
+        return cache_path.read_bytes().decode("utf-8")
+    except FileNotFoundError:
+        pass
+    result = call_ollama(model, prompt)
+    # Escritura atómica: un fichero de caché nunca queda a medias
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(result.encode("utf-8"))
+    os.replace(tmp, cache_path)
+    return result
+
+def iter_chunks(fh: BinaryIO, chunk_size: int, skip: Set[int]) -> Iterator[Tuple[int, str]]:
+    """
+    Recorre el fichero (abierto en binario) en chunks de chunk_size bytes y
+    genera (índice desde 1, texto). Los índices de `skip` no se leen: se saltan
+    con un seek relativo.
+    """
+    parts = -(-os.fstat(fh.fileno()).st_size // chunk_size)
+    for chunk_idx in range(1, parts + 1):
+        if chunk_idx in skip:
+            logging.info(f"⏭️  Saltando chunk {chunk_idx:03d}/{parts} (ya procesado)")
+            fh.seek(chunk_size, os.SEEK_CUR)
+            continue
+        yield chunk_idx, fh.read(chunk_size).decode("utf-8", errors="ignore")
+
+def analyze_chunk(model: str, chunk_idx: int, chunk_text: str, outdir: Path,
+                  cache_dir: Optional[Path] = None) -> int:
+    """Analiza un chunk con Ollama y guarda la respuesta (se ejecuta en un hilo del pool)."""
+    logging.info(f"🧠 Analizando chunk {chunk_idx} ({len(chunk_text):,} chars)...")
+    result = call_ollama_cached(model, build_chunk_prompt(chunk_idx, chunk_text), cache_dir)
+    # Se escribe en .tmp y se renombra: un corte a mitad no deja un chunk truncado que
+    # la reanudación daría por hecho (get_processed_chunks no cuenta los .tmp)
+    chunk_out = outdir / f"api_chunk_{chunk_idx:03d}.txt"
+    tmp = chunk_out.with_name(chunk_out.name + ".tmp")
+    tmp.write_text(result, encoding="utf-8")
+    os.replace(tmp, chunk_out)
+    return chunk_idx
+
+def collect_finished(finished: Set[Future], pending: Dict[Future, int]) -> bool:
+    """Retira de `pending` los chunks terminados. Devuelve False si alguno falló."""
+    ok = True
+    for fut in finished:
+        chunk_idx = pending.pop(fut)
+        try:
+            fut.result()
+        except Exception as e:
+            logging.error(f"Fallo crítico en chunk {chunk_idx}: {e}")
+            ok = False
+    return ok
 
 def main():
     parser = argparse.ArgumentParser(description="Analizador de SQL con Ollama y Regex (Juanj Style)")
     parser.add_argument("--sql", type=Path, required=True, help="Ruta al dump .sql")
     parser.add_argument("--outdir", type=Path, required=True, help="Carpeta de salida")
     parser.add_argument("--model", default=DEFAULT_MODEL, help=f"Modelo Ollama (default: {DEFAULT_MODEL})")
-    parser.add_argument("--chunk-size", type=int, default=CHUNK_CHARS, help="Tamaño del chunk en caracteres")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_CHARS, help="Tamaño del chunk en bytes")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Peticiones a Ollama en paralelo (default: {DEFAULT_WORKERS})")
     parser.add_argument("--no-resume", action="store_true", help="Desactiva la reanudación")
+    parser.add_argument("--no-cache", action="store_true", help=f"No consulta ni guarda respuestas en {CACHE_DIR}")
     args = parser.parse_args()
 
     args.outdir.mkdir(parents=True, exist_ok=True)
     setup_logging(args.outdir)
+    _SESSION.mount("http://", HTTPAdapter(pool_maxsize=args.workers))  # una conexión por hilo
 
     logging.info("🚀 Iniciando proceso de análisis")
     if not args.sql.exists():
         logging.error(f"Fichero SQL no encontrado: {args.sql}")
         return
 
-    full_text = args.sql.read_text(encoding="utf-8", errors="ignore")
-
     # --- Análisis Local (Deterministic) ---
-    logging.info("🔍 Ejecutando análisis Regex local...")
-    schema = parse_schema_local(full_text)
-    
-    local_md = ["# Esquema Detectado (Regex)\n"]
-    for t, data in schema.items():
-        local_md.append(f"## {t}\n**PK**: {', '.join(data['primary_key']) or '-'}\n\n| Columna | Tipo |\n|---|---|\n")
-        for c in data["columns"]:
-            local_md.append(f"| {c['name']} | {c['type']} |\n")
-        for fk in data["foreign_keys"]:
-            local_md.append(f"\n- FK: ({', '.join(fk['columns'])}) -> {fk['ref_table']}\n")
-        local_md.append("\n")
-    
-    (args.outdir / "analysis_local.md").write_text("".join(local_md), encoding="utf-8")
-    logging.info(f"📊 Análisis local guardado.")
+    local_md_path = args.outdir / "analysis_local.md"
+    if not args.no_resume and is_newer(local_md_path, args.sql):
+        logging.info("⏭️  analysis_local.md es posterior al SQL: se omite el análisis local.")
+    else:
+        logging.info("🔍 Ejecutando análisis Regex local...")
+        with open(args.sql, "r", encoding="utf-8", errors="ignore") as f:
+            schema = parse_schema_stream(f, args.chunk_size)
+
+        # Se escribe según se genera, sin materializar el Markdown entero en memoria
+        with open(local_md_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+            write = f.write
+            write("# Esquema Detectado (Regex)\n")
+            for t, data in schema.items():
+                write(f"## {t}\n**PK**: {', '.join(data['primary_key']) or '-'}\n\n| Columna | Tipo |\n|---|---|\n")
+                for n, ty in zip(data["col_names"], data["col_types"]):
+                    write(f"| {n} | {ty} |\n")
+                for c, r in zip(data["fk_cols"], data["fk_ref_tables"]):
+                    write(f"\n- FK: ({', '.join(c)}) -> {r}\n")
+                write("\n")
+
+        logging.info(f"📊 Análisis local guardado.")
 
     # --- Análisis Ollama (AI) ---
     logging.info(f"🤖 Iniciando análisis con Ollama ({args.model})")
-    total_len = len(full_text)
-    parts = math.ceil(total_len / args.chunk_size)
     processed = set() if args.no_resume else get_processed_chunks(args.outdir)
+    cache_dir = None if args.no_cache else CACHE_DIR
 
-    for i in range(parts):
-        chunk_idx = i + 1
-        if chunk_idx in processed:
-            logging.info(f"⏭️  Saltando chunk {chunk_idx:03d} (ya procesado)")
-            continue
-
-        start = i * args.chunk_size
-        end = min((i + 1) * args.chunk_size, total_len)
-        chunk_text = full_text[start:end]
-
-        logging.info(f"🧠 Analizando chunk {chunk_idx}/{parts} ({len(chunk_text):,} chars)...")
-        prompt = (
-            "Analiza el siguiente fragmento SQL y extrae las tablas, relaciones y propósito.\n"
-            f"--- CHUNK {chunk_idx} ---\n```sql\n{chunk_text}\n```"
-        )
-        
-        try:
-            result = call_ollama(args.model, prompt)
-            (args.outdir / f"api_chunk_{chunk_idx:03d}.txt").write_text(result, encoding="utf-8")
-        except Exception as e:
-            logging.error(f"Fallo crítico en chunk {chunk_idx}: {e}")
-            break
+    # El fichero se lee chunk a chunk y hay como mucho `workers` chunks en memoria/en vuelo
+    pending: Dict[Future, int] = {}
+    with open(args.sql, "rb") as f, \
+         ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for chunk_idx, chunk_text in iter_chunks(f, args.chunk_size, processed):
+            fut = executor.submit(analyze_chunk, args.model, chunk_idx, chunk_text, args.outdir, cache_dir)
+            pending[fut] = chunk_idx
+            if len(pending) >= args.workers:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                if not collect_finished(finished, pending):
+                    break  # no se envían más chunks; los que están en vuelo terminan
+        collect_finished(wait(pending).done, pending)
 
-    # Combinación final
+    # Combinación final (copia binaria, sin decodificar)
     final_output = args.outdir / "analysis_ollama_combined.txt"
     chunk_files = sorted(args.outdir.glob("api_chunk_*.txt"))
-    with open(final_output, "w", encoding="utf-8") as f:
+    with open(final_output, "wb") as f:
         for cf in chunk_files:
-            f.write(f"\n\n{'='*20} {cf.name} {'='*20}\n\n")
-            f.write(cf.read_text(encoding="utf-8"))
+            f.write(f"\n\n{'='*20} {cf.name} {'='*20}\n\n".encode("utf-8"))
+            append_file(f, cf)
     
     logging.info(f"✅ Proceso finalizado. Resultado combinado en: {final_output}")
 
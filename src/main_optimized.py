@@ -10,12 +10,13 @@ Este script se encarga de:
 import argparse
 import logging
 import math
+import os
 import sys
 from pathlib import Path
-from typing import Set
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from lib.ollama_client import OllamaClient
+from lib.chunk_files import append_file, get_processed_chunks
+from lib.ollama_client import OllamaClient, build_chunk_prompt
 from lib.sql_processor import SQLProcessor
 CHUNK_CHARS = 100_000 # Más pequeño para paralelo
 DEFAULT_WORKERS = 3
@@ -32,27 +33,16 @@ def setup_logging(outdir: Path):
         ]
     )
 
-def get_processed_chunks(outdir: Path) -> Set[int]:
-    """Detecta qué chunks ya existen en disco."""
-    processed = set()
-    for f in outdir.glob("api_chunk_*.txt"):
-        try:
-            # api_chunk_001.txt -> 1
-            idx = int(f.name.split('_')[-1].split('.')[0])
-            processed.add(idx)
-        except: continue
-    return processed
-
 def process_chunk(chunk_idx: int, chunk_text: str, client: OllamaClient, outdir: Path):
     """Tarea individual para un hilo."""
     logging.info(f"🧠 Analizando chunk {chunk_idx} ({len(chunk_text):,} chars)...")
-    prompt = (
-        "Analiza el siguiente fragmento SQL y extrae las tablas, relaciones y propósito.\n"
-        f"--- CHUNK {chunk_idx} ---\n```sql\n{chunk_text}\n```"
-    )
     try:
-        result = client.call_generate(prompt)
-        (outdir / f"api_chunk_{chunk_idx:03d}.txt").write_text(result, encoding="utf-8")
+        result = client.call_generate(build_chunk_prompt(chunk_idx, chunk_text))
+        # .tmp + os.replace: nunca queda un api_chunk_###.txt a medias
+        chunk_out = outdir / f"api_chunk_{chunk_idx:03d}.txt"
+        tmp = chunk_out.with_name(chunk_out.name + ".tmp")
+        tmp.write_text(result, encoding="utf-8")
+        os.replace(tmp, chunk_out)
         return chunk_idx
     except Exception as e:
         logging.error(f"Fallo en chunk {chunk_idx}: {e}")
@@ -86,12 +76,14 @@ def main():
     skeleton_text = skeleton_path.read_text(encoding="utf-8", errors="ignore")
     schema = processor.parse_schema_local(skeleton_text)
     
-    local_md = ["# Esquema (Skeleton Analysis)\n"]
-    for t, data in schema.items():
-        local_md.append(f"## {t}\n**PK**: {', '.join(data['primary_key']) or '-'}\n\n| Col | Tipo |\n|---|---|\n")
-        local_md.append("".join([f"| {c['name']} | {c['type']} |\n" for c in data["columns"]]))
-        local_md.append("\n")
-    (args.outdir / "analysis_local.md").write_text("".join(local_md), encoding="utf-8")
+    with open(args.outdir / "analysis_local.md", "w", encoding="utf-8", buffering=1 << 20) as f:
+        write = f.write
+        write("# Esquema (Skeleton Analysis)\n")
+        for t, data in schema.items():
+            write(f"## {t}\n**PK**: {', '.join(data['primary_key']) or '-'}\n\n| Col | Tipo |\n|---|---|\n")
+            for c in data["columns"]:
+                write(f"| {c['name']} | {c['type']} |\n")
+            write("\n")
 
     # 3. Análisis Ollama Paralelo
     client = OllamaClient(model=args.model)
@@ -116,13 +108,13 @@ def main():
             res = future.result()
             if res: logging.info(f"✅ Chunk {res} completado.")
 
-    # 4. Combinación
+    # 4. Combinación (copia binaria, sin decodificar)
     logging.info("Finalizando...")
     chunk_files = sorted(args.outdir.glob("api_chunk_*.txt"))
-    with open(args.outdir / "analysis_ollama_combined.txt", "w", encoding="utf-8") as f:
+    with open(args.outdir / "analysis_ollama_combined.txt", "wb") as f:
         for cf in chunk_files:
-            f.write(f"\n\n{'='*20} {cf.name} {'='*20}\n\n")
-            f.write(cf.read_text(encoding="utf-8"))
+            f.write(f"\n\n{'='*20} {cf.name} {'='*20}\n\n".encode("utf-8"))
+            append_file(f, cf)
 
     logging.info(f"✨ Proceso completado. Revisa {args.outdir}")
 
@@ -0,0 +1,168 @@
+import hashlib
+import sys
+from pathlib import Path
+import pytest
+
+# Los scripts de src/app importan `_core` como módulo suelto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "app"))
+import _core
+
+@pytest.fixture
+def fake_batches(monkeypatch):
+    """Sustituye la llamada a Ollama: cada chunk se responde con su propio texto."""
+    calls = []
+    def process_batch(model, chunks, outdir):
+        calls.append([idx for idx, _ in chunks])
+        saved = {}
+        for idx, text in chunks:
+            path = Path(outdir) / f"api_chunk_{idx:03d}.txt"
+            path.write_text(f"resp {text}", encoding="utf-8")
+            saved[idx] = str(path)
+        return saved
+    monkeypatch.setattr(_core, "process_batch", process_batch)
+    return calls
+
+def _run(sql, outdir, use_cache):
+    _core.run_api_chunks(str(sql), str(outdir), "m", 4, 2, 1, use_cache=use_cache)
+    return {i: (outdir / f"api_chunk_{i:03d}.txt").read_text(encoding="utf-8") for i in (1, 2, 3)}
+
+def test_run_api_chunks_cache_switch(tmp_path, fake_batches):
+    sql = tmp_path / "dump.sql"
+    sql.write_bytes(b"AAAABBBBCCCC")
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    expected = {1: "resp AAAA", 2: "resp BBBB", 3: "resp CCCC"}
+
+    assert _run(sql, outdir, use_cache=True) == expected
+    assert len(fake_batches) == 3
+    # Segunda pasada: todo sale de la caché del outdir
+    assert _run(sql, outdir, use_cache=True) == expected
+    assert len(fake_batches) == 3
+    # Sin caché se vuelve a preguntar al modelo
+    assert _run(sql, outdir, use_cache=False) == expected
+    assert len(fake_batches) == 6
+
+def test_run_api_chunks_without_cache_creates_no_db(tmp_path, fake_batches):
+    sql = tmp_path / "dump.sql"
+    sql.write_bytes(b"AAAA")
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    _core.run_api_chunks(str(sql), str(outdir), "m", 4, 1, 1, use_cache=False)
+    assert not (outdir / _core.CHUNK_CACHE_FILE).exists()
+
+def test_chunk_hash_depends_on_model_and_prompts():
+    raw = b"CREATE TABLE t (id INT);"
+    assert _core.chunk_hash("a", raw) == _core.chunk_hash("a", raw)
+    assert _core.chunk_hash("a", raw) != _core.chunk_hash("b", raw)
+    # Las claves antiguas (solo modelo + chunk) no se reutilizan
+    assert _core.chunk_hash("a", raw) != hashlib.blake2b(b"a\0" + raw, digest_size=16).hexdigest()
+
+def test_split_batch_response_keeps_complete_fragments():
+    text = (
+        "===FRAG_BEGIN 001===\nuno\n===FRAG_END 001===\n"
+        "===FRAG_BEGIN 002===\ndos\n===FRAG_END 003===\n"  # cierre de otro fragmento
+        "===FRAG_BEGIN 004===\ncuatro (truncado)"
+    )
+    assert _core.split_batch_response(text) == {1: "uno"}
+    assert _core.split_batch_response(None) == {}
+
+def test_process_batch_halves_truncated_batches(tmp_path, monkeypatch):
+    batch_sizes, singles = [], []
+    def call_text(model, prompt):
+        frags = [int(i) for i in _core.re.findall(r"===FRAG_BEGIN (\d+)===\n```sql", prompt)]
+        batch_sizes.append(len(frags))
+        if len(frags) > 2:
+            frags = frags[:-1]  # respuesta cortada: falta el último FRAG_END
+        return "".join(f"===FRAG_BEGIN {i:03d}===\nresp {i}\n===FRAG_END {i:03d}===\n" for i in frags)
+    def stream_to_file(model, prompt, path):
+        singles.append(path)
+        Path(path).write_text("resp suelta", encoding="utf-8")
+        return path
+    monkeypatch.setattr(_core, "call_ollama_chunk_text", call_text)
+    monkeypatch.setattr(_core, "stream_ollama_chunk_to_file", stream_to_file)
+
+    chunks = [(i, f"SELECT {i};") for i in range(1, 6)]
+    saved = _core.process_batch("m", chunks, str(tmp_path))
+
+    assert sorted(saved) == [1, 2, 3, 4, 5]
+    assert batch_sizes == [5, 2, 3, 2]  # 5 → 2 + 3, y el de 3 → 1 + 2
+    assert len(singles) == 1
+    assert (tmp_path / "api_chunk_001.txt").read_text(encoding="utf-8") == "resp 1"
+    assert not list(tmp_path.glob("*.tmp"))
+
+SQL = (
+    b"Create TaBlE `a` (\n  `id` int,\n  `c` varchar(30) DEFAULT 'create table b (x int',\n"
+    b"  PRIMARY KEY (`id`)\n);\n"
+    b"INSERT INTO `a` VALUES (1,'x');\n"
+    b"create table c (\n  id INT,\n  a_id INT,\n  FOREIGN KEY (a_id) REFERENCES a (id)\n);\n"
+)
+
+def test_iter_create_tables_casings_and_regions():
+    names = [m.group(1) for m in _core.iter_create_tables(SQL)]
+    assert names == [b"a", b"c"]
+    # Con overlapping también aparece el candidato que cae dentro del cuerpo de `a`
+    names = [m.group(1) for m in _core.iter_create_tables(SQL, overlapping=True)]
+    assert names == [b"a", b"b", b"c"]
+    # Solo sentencias que empiezan en [start, end)
+    c_start = SQL.index(b"create table c")
+    assert [m.group(1) for m in _core.iter_create_tables(SQL, 1, c_start)] == [b"b"]
+    assert [m.group(1) for m in _core.iter_create_tables(SQL, 1, c_start + 1)] == [b"b", b"c"]
+
+def test_parse_schema_local_columns_pk_fk():
+    schema = _core.parse_schema_local(SQL)
+    assert list(schema) == ["a", "c"]
+    assert schema["a"]["col_names"] == ["id", "c"]
+    assert schema["a"]["primary_key"] == ["id"]
+    assert schema["c"]["fk_cols"] == [["a_id"]]
+    assert schema["c"]["fk_ref_tables"] == ["a"]
+
+def test_parse_schema_file_parallel_matches_sequential(tmp_path, monkeypatch):
+    dump = tmp_path / "dump.sql"
+    dump.write_bytes(SQL * 20)
+    expected = _core.parse_schema_local(SQL * 20)
+    assert _core.parse_schema_file(str(dump)) == expected
+    # Regiones pequeñas: las sentencias quedan partidas entre procesos
+    monkeypatch.setattr(_core, "LOCAL_PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(_core, "LOCAL_WORKERS", 3)
+    schema = _core.parse_schema_file(str(dump))
+    assert schema == expected
+    assert list(schema) == list(expected)
+
+def test_write_local_markdown(tmp_path):
+    out = tmp_path / "analysis_local.md"
+    _core.write_local_markdown(_core.parse_schema_local(SQL), str(out))
+    md = out.read_text(encoding="utf-8")
+    assert "## a\n**Primary Key**: id\n" in md
+    assert "- (a_id) → a(id)\n" in md
+
+def test_skip_chars_for_chunks_clamps_to_end(tmp_path):
+    import mmap
+    path = tmp_path / "dump.sql"
+    path.write_bytes(b"0123456789")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        _core.skip_chars_for_chunks(mm, 2, 4)
+        assert mm.read(4) == b"89"
+        _core.skip_chars_for_chunks(mm, 5, 4)
+        assert mm.tell() == 10
+
+def test_combine_api_chunks_in_order(tmp_path):
+    for idx, text in ((2, "dos"), (10, "diez"), (1, "uno")):
+        (tmp_path / f"api_chunk_{idx:03d}.txt").write_text(text, encoding="utf-8")
+    (tmp_path / "api_chunk_003.txt.tmp").write_text("a medias", encoding="utf-8")
+    combined = Path(_core.combine_api_chunks(str(tmp_path))).read_text(encoding="utf-8")
+    assert combined == (
+        "===== api_chunk_001.txt =====\nuno\n\n"
+        "===== api_chunk_002.txt =====\ndos\n\n"
+        "===== api_chunk_010.txt =====\ndiez\n\n"
+    )
+
+def test_chunk_cache_roundtrip(tmp_path):
+    cache = _core.open_chunk_cache(str(tmp_path))
+    try:
+        key = _core.chunk_hash("m", b"AAAA")
+        assert _core.cached_response(cache, key) is None
+        cache.execute("INSERT OR REPLACE INTO cache (hash, response) VALUES (?, ?)", (key, b"resp"))
+        cache.commit()
+        assert _core.cached_response(cache, key) == b"resp"
+    finally:
+        cache.close()
@@ -0,0 +1,32 @@
+import os
+from src.lib.chunk_files import append_file, get_processed_chunks
+
+def _combine(tmp_path, parts):
+    out_path = tmp_path / "combined.txt"
+    with open(out_path, "wb") as out:
+        for i, data in enumerate(parts):
+            src = tmp_path / f"api_chunk_{i:03d}.txt"
+            src.write_bytes(data)
+            out.write(b"== cabecera ==\n")  # queda en el buffer de `out` antes de copiar
+            append_file(out, src)
+    return out_path.read_bytes()
+
+PARTS = [b"primero\n", "segundo ñ\n".encode("utf-8"), b"", b"x" * (3 << 20)]
+EXPECTED = b"".join(b"== cabecera ==\n" + p for p in PARTS)
+
+def test_append_file_sendfile(tmp_path):
+    assert _combine(tmp_path, PARTS) == EXPECTED
+
+def test_append_file_copyfileobj_fallback(tmp_path, monkeypatch):
+    def failing_sendfile(*args):
+        raise OSError("sendfile no soportado")
+    monkeypatch.setattr(os, "sendfile", failing_sendfile, raising=False)
+    assert _combine(tmp_path, PARTS) == EXPECTED
+
+def test_append_file_without_sendfile(tmp_path, monkeypatch):
+    monkeypatch.delattr(os, "sendfile", raising=False)
+    assert _combine(tmp_path, PARTS) == EXPECTED
+
+def test_get_processed_chunks_accepts_str(tmp_path):
+    (tmp_path / "api_chunk_1000.txt").write_text("data")
+    assert get_processed_chunks(str(tmp_path)) == {1000}
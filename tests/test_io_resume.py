@@ -1,6 +1,7 @@
+import os
 import pytest
 from pathlib import Path
-from src.main import get_processed_chunks
+from src.main import get_processed_chunks, is_newer
 
 def test_get_processed_chunks_empty(tmp_path):
     assert get_processed_chunks(tmp_path) == set()
@@ -19,6 +20,26 @@ def test_get_processed_chunks_with_files(tmp_path):
     assert 5 in processed
     assert 2 not in processed
 
+def test_get_processed_chunks_ignores_tmp(tmp_path):
+    # Escritura interrumpida antes del os.replace
+    (tmp_path / "api_chunk_001.txt").write_text("data")
+    (tmp_path / "api_chunk_002.txt.tmp").write_text("da")
+    assert get_processed_chunks(tmp_path) == {1}
+
 def test_get_processed_chunks_wrong_format(tmp_path):
     (tmp_path / "api_chunk_abc.txt").write_text("data")
     assert get_processed_chunks(tmp_path) == set()
+
+def test_is_newer(tmp_path):
+    sql = tmp_path / "dump.sql"
+    md = tmp_path / "analysis_local.md"
+    sql.write_text("CREATE TABLE t (id INT);")
+    assert not is_newer(md, sql)  # el .md aún no existe
+
+    md.write_text("# Esquema")
+    os.utime(sql, ns=(1_000_000_000, 1_000_000_000))
+    os.utime(md, ns=(2_000_000_000, 2_000_000_000))
+    assert is_newer(md, sql)
+
+    os.utime(sql, ns=(3_000_000_000, 3_000_000_000))  # el SQL cambió después
+    assert not is_newer(md, sql)
@@ -1,8 +1,9 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from src.main import call_ollama
+from src.main import call_ollama, call_ollama_cached
+from src.lib.ollama_client import build_chunk_prompt
 
-@patch("requests.post")
+@patch("src.main._SESSION.post")
 def test_call_ollama_success(mock_post):
     # Setup mock
     mock_response = MagicMock()
@@ -15,7 +16,7 @@ def test_call_ollama_success(mock_post):
     assert result == "Análisis IA"
     mock_post.assert_called_once()
 
-@patch("requests.post")
+@patch("src.main._SESSION.post")
 @patch("time.sleep", return_value=None) # Skip sleep during tests
 def test_call_ollama_retry_success(mock_sleep, mock_post):
     # Setup mock: 1 failure then 1 success
@@ -33,7 +34,7 @@ def test_call_ollama_retry_success(mock_sleep, mock_post):
     assert result == "Éxito tras reintento"
     assert mock_post.call_count == 2
 
-@patch("requests.post")
+@patch("src.main._SESSION.post")
 @patch("time.sleep", return_value=None)
 def test_call_ollama_total_failure(mock_sleep, mock_post):
     # Setup mock: always fails
@@ -45,3 +46,24 @@ def test_call_ollama_total_failure(mock_sleep, mock_post):
         call_ollama("test-model", "test-prompt")
     
     assert mock_post.call_count == 3 # Default MAX_RETRIES
+
+@patch("src.main._SESSION.post")
+def test_call_ollama_cached_reuses_response(mock_post, tmp_path):
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"response": "Respuesta cacheada"}
+    mock_post.return_value = mock_response
+
+    first = call_ollama_cached("test-model", "test-prompt", tmp_path)
+    second = call_ollama_cached("test-model", "test-prompt", tmp_path)
+
+    assert first == second == "Respuesta cacheada"
+    mock_post.assert_called_once()
+    # Otro modelo con el mismo prompt no comparte entrada
+    call_ollama_cached("otro-model", "test-prompt", tmp_path)
+    assert mock_post.call_count == 2
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_build_chunk_prompt():
+    prompt = build_chunk_prompt(7, "SELECT 1;")
+    assert "--- CHUNK 7 ---" in prompt
+    assert prompt.endswith("```sql\nSELECT 1;\n```")
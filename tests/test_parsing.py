@@ -1,5 +1,7 @@
+import io
 import pytest
-from src.main import parse_schema_local
+from multiprocessing import Pool
+from src.main import parse_schema_local, parse_schema_stream
 
 def test_parse_schema_local_basic():
     sql = """
@@ -11,8 +13,8 @@ def test_parse_schema_local_basic():
     schema = parse_schema_local(sql)
     assert "users" in schema
     assert schema["users"]["primary_key"] == ["id"]
-    assert len(schema["users"]["columns"]) == 2
-    assert schema["users"]["columns"][0]["name"] == "id"
+    assert schema["users"]["col_names"] == ["id", "name"]
+    assert schema["users"]["col_types"] == ["INT", "VARCHAR(100)"]
 
 def test_parse_schema_local_with_fk():
     sql = """
@@ -24,11 +26,9 @@ def test_parse_schema_local_with_fk():
     """
     schema = parse_schema_local(sql)
     assert "orders" in schema
-    assert len(schema["orders"]["foreign_keys"]) == 1
-    fk = schema["orders"]["foreign_keys"][0]
-    assert fk["columns"] == ["user_id"]
-    assert fk["ref_table"] == "users"
-    assert fk["ref_columns"] == ["id"]
+    assert schema["orders"]["fk_cols"] == [["user_id"]]
+    assert schema["orders"]["fk_ref_tables"] == ["users"]
+    assert schema["orders"]["fk_ref_cols"] == [["id"]]
 
 def test_parse_schema_local_composite_pk():
     sql = """
@@ -51,7 +51,7 @@ def test_parse_schema_local_inline_backticks():
     schema = parse_schema_local(sql)
     assert "orders" in schema
     assert schema["orders"]["primary_key"] == ["order_id"]
-    assert schema["orders"]["columns"][1]["name"] == "status"
+    assert schema["orders"]["col_names"][1] == "status"
 
 def test_parse_schema_local_empty():
     assert parse_schema_local("") == {}
@@ -61,3 +61,95 @@ def test_parse_schema_local_messy_whitespace():
     schema = parse_schema_local(sql)
     assert "test" in schema
     assert schema["test"]["primary_key"] == ["col1"]
+
+def test_parse_schema_stream_matches_local():
+    sql = """
+    CREATE TABLE users (
+        id INT PRIMARY KEY,
+        name VARCHAR(100)
+    );
+    INSERT INTO users VALUES (1, 'created');
+    CREATE TABLE orders (
+        order_id INT,
+        user_id INT,
+        PRIMARY KEY (order_id),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+    """
+    # Bloques pequeños: las sentencias quedan partidas entre lecturas
+    for block_size in (1, 7, 64, len(sql)):
+        assert parse_schema_stream(io.StringIO(sql), block_size) == parse_schema_local(sql)
+
+def test_parse_schema_local_keyword_casings():
+    from src.lib.sql_processor import SQLProcessor
+    sql = """
+    Create TaBlE a (
+        id INT
+    );
+    create table b (
+        id INT
+    );
+    CREATE
+    TABLE c (
+        id INT
+    );
+    """
+    assert list(parse_schema_local(sql)) == ["a", "b", "c"]
+    assert list(SQLProcessor.parse_schema_local(sql)) == ["a", "b", "c"]
+    # Fuera de CREATE/create/Create no hay candidato, en ninguno de los analizadores
+    odd = "cReAtE TABLE d (\n    id INT\n);\n"
+    assert parse_schema_local(odd) == {} == SQLProcessor.parse_schema_local(odd)
+
+@pytest.mark.parametrize("column", [
+    'id INT COMMENT "user\'s id",',
+    "id INT, -- it's the key",
+    "id INT DEFAULT 'it,",
+])
+def test_parse_schema_unmatched_quote_keeps_following_tables(column):
+    sql = f"""
+    CREATE TABLE users (
+        {column}
+        name VARCHAR(100)
+    );
+    CREATE TABLE orders (
+        order_id INT PRIMARY KEY
+    );
+    """
+    schema = parse_schema_local(sql)
+    assert list(schema) == ["users", "orders"]
+    assert schema["orders"]["primary_key"] == ["order_id"]
+    for block_size in (1, 7, 64, len(sql)):
+        assert parse_schema_stream(io.StringIO(sql), block_size) == schema
+
+def test_parse_schema_stream_drops_unclosed_create(monkeypatch):
+    import src.main
+    monkeypatch.setattr(src.main, "_MAX_CREATE_CHARS", 200)
+    sql = ("CREATE TABLE broken (id INT,\n"
+           + "INSERT INTO t VALUES (1, 'x');\n" * 100
+           + "CREATE TABLE ok (\n    id INT\n);\n")
+    assert list(parse_schema_local(sql)) == ["ok"]
+    assert list(parse_schema_stream(io.StringIO(sql), 64)) == ["ok"]
+
+def test_parse_schema_pool_matches_sequential(monkeypatch):
+    import src.main
+    sql = "".join(
+        f"CREATE TABLE t{i} (\n    id INT PRIMARY KEY,\n    p_id INT,\n"
+        f"    FOREIGN KEY (p_id) REFERENCES t0(id)\n);\n"
+        for i in range(50)
+    )
+    expected = parse_schema_local(sql)
+    pools = []
+    def spy_pool(*args, **kwargs):
+        pools.append(1)
+        return Pool(*args, **kwargs)
+    monkeypatch.setattr(src.main, "_PARALLEL_MIN_TABLES", 2)
+    monkeypatch.setattr(src.main, "Pool", spy_pool)
+    # Con una sola CPU no se arranca el Pool
+    monkeypatch.setattr(src.main, "_LOCAL_WORKERS", 1)
+    assert parse_schema_local(sql) == expected
+    assert not pools
+    monkeypatch.setattr(src.main, "_LOCAL_WORKERS", 2)
+    assert parse_schema_local(sql) == expected
+    assert list(parse_schema_local(sql)) == [f"t{i}" for i in range(50)]
+    assert parse_schema_stream(io.StringIO(sql), 100) == expected
+    assert len(pools) == 3
@@ -40,3 +40,46 @@ def test_schema_to_mermaid():
     assert "Users ||--o{ Posts : \"user_id\"" in mermaid_str
     assert "INT id PK" in mermaid_str
     assert "INT user_id FK" in mermaid_str
+
+def test_parse_schema_local_with_re2():
+    re2 = pytest.importorskip("re2")
+    from src.lib import sql_processor
+    assert sql_processor._re_fast is re2
+    sql = """
+    create table Personas (
+        id INT PRIMARY KEY,
+        nombre VARCHAR(100) DEFAULT 'José'
+    );
+    CREATE TABLE Casas (
+        id INT,
+        persona_id INT,
+        PRIMARY KEY (id),
+        FOREIGN KEY (persona_id) REFERENCES Personas(id)
+    );
+    """
+    schema = SQLProcessor.parse_schema_local(sql)
+    assert list(schema) == ["Personas", "Casas"]
+    assert schema["Casas"]["foreign_keys"][0]["ref_table"] == "Personas"
+    assert schema["Personas"]["columns"][1] == {"name": "nombre", "type": "VARCHAR"}
+
+def test_parse_schema_local_many_tables_is_linear():
+    # Con google-re2 instalado, un match(str, pos) por tabla era cuadrático (2000 tablas: ~7 s)
+    import time
+    table = ("CREATE TABLE t{0} (\n    id INT PRIMARY KEY,\n    nombre VARCHAR(20) DEFAULT 'José',\n"
+             "    padre_id INT,\n    FOREIGN KEY (padre_id) REFERENCES t0(id)\n);\n"
+             "INSERT INTO t{0} VALUES (1, 'Ana', NULL);\n")
+    sql = "".join(table.format(i) for i in range(4000))
+    start = time.perf_counter()
+    schema = SQLProcessor.parse_schema_local(sql)
+    assert time.perf_counter() - start < 2.0
+    assert len(schema) == 4000
+    assert schema["t3999"]["foreign_keys"][0]["ref_table"] == "t0"
+
+def test_parse_schema_local_insert_only_skips_regex(monkeypatch):
+    from src.lib import sql_processor
+    class NoMatch:
+        def match(self, *args):
+            raise AssertionError("_CREATE_RE no debería ejecutarse sin CREATE")
+    monkeypatch.setattr(sql_processor, "_CREATE_RE", NoMatch())
+    sql = "INSERT INTO Personas VALUES (1, 'table');\n" * 100
+    assert SQLProcessor.parse_schema_local(sql) == {}